@@ -1,56 +1,111 @@
-
 import { NextResponse } from 'next/server'
-import { writeFile } from 'fs/promises'
-import path from 'path'
-import { exec } from 'child_process'
-import { promisify } from 'util'
+import { jobStatus, RenderEvent, submitJob, videoUrl, watchJob } from '@/lib/render-service'
+
+// Renders run in the resident Python service (renderer/server.py), one output
+// file per job, so concurrent requests no longer overwrite each other.
+//
+//   POST /api/render              submit and wait for the video (editor default)
+//   POST /api/render?wait=0       submit and return the job id straight away
+//   POST /api/render?preview=1    fast draft (smaller frames, lower fps)
+//        &stage=K | &frames=a:b   render only one stage / a frame slice
+//   GET  /api/render?job=ID       poll a job's status
+//   GET  /api/render?job=ID&stream=1
+//                                 server-sent progress events until it finishes
 
-const execAsync = promisify(exec)
+function withUrl(event: RenderEvent) {
+    return event.event === 'done' && event.output
+        ? { ...event, videoUrl: videoUrl(event.output) }
+        : event
+}
+
+function renderOptions(params: URLSearchParams) {
+    const options: Record<string, unknown> = {}
+    if (params.get('preview') === '1') options.preview = true
+    const stage = params.get('stage')
+    if (stage) options.stage = Number(stage)
+    const frames = params.get('frames')
+    if (frames) {
+        options.frames = frames.split(':').map((n) => (n === '' ? null : Number(n)))
+    }
+    return options
+}
 
 export async function POST(req: Request) {
     try {
         const data = await req.json()
+        const params = new URL(req.url).searchParams
+        const wait = params.get('wait') !== '0'
 
-        // 1. Save JSON to temp file
-        // We'll save it in the root directory effectively, or specific temp dir
-        const tempFilePath = path.join(process.cwd(), 'temp_render_data.json')
-        await writeFile(tempFilePath, JSON.stringify(data, null, 2))
-
-        console.log('Saved temp data to:', tempFilePath)
+        const queued = await submitJob(data, renderOptions(params))
+        const job = queued.job!
+        console.log('Queued render job:', job)
 
-        // 2. Run Python script
-        // We assume the renderer virtual environment is set up.
-        // We might need to activate it or call the python binary directly.
-        // Let's try to use the 'run.sh' if it handles everything, or call python directly if we know the path.
-        // For reliability in this specific environment, let's try to run `renderer/run.sh` but modified to accept input?
-        // Or just call the python executable in the venv directly.
+        if (!wait) {
+            return NextResponse.json({
+                success: true,
+                jobId: job,
+                statusUrl: `/api/render?job=${job}`
+            })
+        }
 
-        // Command to run render.py
-        // We are in project root.
-        // render.py looks for standard files by default, but we'll modify it to look for temp_render_data.json if present.
+        const result = await watchJob(job)
 
-        const pythonScript = path.join(process.cwd(), 'renderer', 'render.py')
-        const venvPython = path.join(process.cwd(), 'renderer', 'venv', 'bin', 'python3')
+        if (result?.event !== 'done' || !result.output) {
+            throw new Error(result?.error ?? 'Render did not finish')
+        }
 
-        // Check if venv python exists, otherwise fallback to system python (risky but okay for now)
-        // Actually, simpler: Assuming run.sh sets up env.
-
-        const command = `"${venvPython}" "${pythonScript}" --input "${tempFilePath}" --output "${path.join(process.cwd(), 'public', 'rendered_video.mp4')}"`
+        return NextResponse.json({
+            success: true,
+            jobId: job,
+            videoUrl: videoUrl(result.output),
+            elapsed: result.elapsed
+        })
+    } catch (error) {
+        console.error('Render failed:', error)
+        return NextResponse.json(
+            { success: false, error: String(error) },
+            { status: 500 }
+        )
+    }
+}
 
-        console.log('Executing:', command)
+export async function GET(req: Request) {
+    const params = new URL(req.url).searchParams
+    const job = params.get('job')
+    if (!job) {
+        return NextResponse.json({ error: 'Missing job id.' }, { status: 400 })
+    }
 
-        const { stdout, stderr } = await execAsync(command)
+    try {
+        if (params.get('stream') !== '1') {
+            const status = await jobStatus(job)
+            const code = status.event === 'error' ? 404 : 200
+            return NextResponse.json(withUrl(status), { status: code })
+        }
 
-        console.log('Python Output:', stdout)
-        if (stderr) console.error('Python Error:', stderr)
+        const encoder = new TextEncoder()
+        const stream = new ReadableStream({
+            async start(controller) {
+                try {
+                    await watchJob(job, (event) => {
+                        controller.enqueue(encoder.encode(`data: ${JSON.stringify(withUrl(event))}\n\n`))
+                    })
+                } catch (e) {
+                    controller.enqueue(encoder.encode(`data: ${JSON.stringify({ event: 'error', error: String(e) })}\n\n`))
+                } finally {
+                    controller.close()
+                }
+            }
+        })
 
-        return NextResponse.json({
-            success: true,
-            videoUrl: '/rendered_video.mp4',
-            logs: stdout
+        return new Response(stream, {
+            headers: {
+                'Content-Type': 'text/event-stream',
+                'Cache-Control': 'no-cache'
+            }
         })
     } catch (error) {
-        console.error('Render failed:', error)
+        console.error('Render status failed:', error)
         return NextResponse.json(
             { success: false, error: String(error) },
             { status: 500 }
@@ -0,0 +1,59 @@
+import { NextResponse } from 'next/server'
+import { readFile } from 'fs/promises'
+import path from 'path'
+import { existsSync } from 'fs'
+import { RENDER_OUTPUT_DIR } from '@/lib/render-service'
+
+// Render outputs are written at request time, after `next build`, so they
+// can't live in public/ and are served from here instead.
+
+export async function GET(
+    request: Request,
+    { params }: { params: Promise<{ filename: string }> }
+) {
+    const { filename } = await params
+    const filePath = path.join(RENDER_OUTPUT_DIR, path.basename(filename))
+
+    if (!existsSync(filePath)) {
+        return new NextResponse('File not found', { status: 404 })
+    }
+
+    try {
+        const fileBuffer = await readFile(filePath)
+
+        const ext = path.extname(filename).toLowerCase()
+        let contentType = 'application/octet-stream'
+        if (ext === '.mp4') contentType = 'video/mp4'
+        else if (ext === '.webm') contentType = 'video/webm'
+
+        // <video> seeks with byte ranges (Safari won't play without them)
+        const range = request.headers.get('range')?.match(/^bytes=(\d*)-(\d*)$/)
+        if (range && (range[1] || range[2])) {
+            const size = fileBuffer.length
+            const start = range[1] ? Number(range[1]) : Math.max(size - Number(range[2]), 0)
+            const end = range[1] && range[2] ? Math.min(Number(range[2]), size - 1) : size - 1
+            if (start > end || start >= size) {
+                return new NextResponse(null, {
+                    status: 416,
+                    headers: { 'Content-Range': `bytes */${size}` }
+                })
+            }
+            return new NextResponse(fileBuffer.subarray(start, end + 1), {
+                status: 206,
+                headers: {
+                    'Content-Type': contentType,
+                    'Content-Range': `bytes ${start}-${end}/${size}`,
+                    'Content-Length': String(end - start + 1),
+                    'Accept-Ranges': 'bytes'
+                }
+            })
+        }
+
+        return new NextResponse(fileBuffer, {
+            headers: { 'Content-Type': contentType, 'Accept-Ranges': 'bytes' }
+        })
+    } catch (e) {
+        console.error("Error serving render:", e)
+        return new NextResponse('Error serving file', { status: 500 })
+    }
+}
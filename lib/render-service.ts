@@ -0,0 +1,175 @@
+import net from 'net'
+import path from 'path'
+import { spawn } from 'child_process'
+
+// Client for the resident Python render service (renderer/server.py).
+// The service is started on first use and then kept running, so each render
+// skips interpreter start-up and reuses already-decoded assets.
+
+const RENDERER_DIR = path.join(process.cwd(), 'renderer')
+const SOCKET_PATH = path.join(RENDERER_DIR, 'render.sock')
+// Outside public/: files added after `next build` aren't served from there,
+// so finished videos go through app/api/renders/[filename] instead
+export const RENDER_OUTPUT_DIR = path.join(RENDERER_DIR, 'renders')
+const CACHE_DIR = path.join(RENDERER_DIR, '.cache', 'segments')
+const ASSET_CACHE_DIR = path.join(RENDERER_DIR, '.cache', 'assets')
+const STARTUP_TIMEOUT_MS = 30_000
+
+export interface RenderEvent {
+  event: 'queued' | 'progress' | 'done' | 'failed' | 'error' | 'pong'
+  job?: string
+  state?: 'queued' | 'running' | 'done' | 'failed'
+  frame?: number
+  total?: number
+  fps?: number
+  eta?: number
+  elapsed?: number
+  output?: string
+  error?: string
+}
+
+let starting: Promise<void> | null = null
+
+function connect(): Promise<net.Socket> {
+  return new Promise((resolve, reject) => {
+    const socket = net.createConnection(SOCKET_PATH)
+    socket.once('connect', () => resolve(socket))
+    socket.once('error', reject)
+  })
+}
+
+async function ensureService(): Promise<void> {
+  try {
+    ;(await connect()).end()
+    return
+  } catch {
+    // Not running yet
+  }
+  if (!starting) {
+    starting = (async () => {
+      const python = path.join(RENDERER_DIR, 'venv', 'bin', 'python3')
+      const child = spawn(
+        python,
+        [
+          path.join(RENDERER_DIR, 'server.py'),
+          '--socket', SOCKET_PATH,
+          '--output-dir', RENDER_OUTPUT_DIR,
+          '--cache-dir', CACHE_DIR,
+          '--asset-cache', ASSET_CACHE_DIR,
+        ],
+        { cwd: process.cwd(), detached: true, stdio: 'inherit' }
+      )
+      child.unref()
+
+      // A missing interpreter or a crash at import rejects at once instead
+      // of polling until the timeout (and keeps 'error' from going unhandled)
+      let settled = false
+      const failed = new Promise<never>((_, reject) => {
+        child.once('error', (e) => reject(new Error(`Render service failed to start: ${e.message}`)))
+        child.once('exit', (code, signal) =>
+          reject(new Error(`Render service exited during start-up (${signal ?? `code ${code}`})`))
+        )
+      })
+      // Exits after start-up are not this call's concern
+      failed.catch(() => {})
+
+      const ready = (async () => {
+        const deadline = Date.now() + STARTUP_TIMEOUT_MS
+        while (!settled && Date.now() < deadline) {
+          try {
+            ;(await connect()).end()
+            return
+          } catch {
+            await new Promise((r) => setTimeout(r, 200))
+          }
+        }
+        throw new Error('Render service did not start')
+      })()
+
+      try {
+        await Promise.race([ready, failed])
+      } finally {
+        settled = true
+      }
+    })().finally(() => {
+      starting = null
+    })
+  }
+  await starting
+}
+
+/**
+ * Send one message and feed every reply event to `onEvent` until it returns
+ * true (or the service closes the connection). Resolves with the last event.
+ */
+export async function request(
+  message: Record<string, unknown>,
+  onEvent: (event: RenderEvent) => boolean | void
+): Promise<RenderEvent | undefined> {
+  await ensureService()
+  const socket = await connect()
+
+  return new Promise((resolve, reject) => {
+    let buffer = ''
+    let last: RenderEvent | undefined
+    let finished = false
+    const finish = (error?: Error) => {
+      if (finished) return
+      finished = true
+      socket.end()
+      if (error) reject(error)
+      else resolve(last)
+    }
+
+    socket.on('data', (chunk) => {
+      buffer += chunk.toString()
+      let newline
+      while ((newline = buffer.indexOf('\n')) >= 0) {
+        const line = buffer.slice(0, newline)
+        buffer = buffer.slice(newline + 1)
+        if (!line.trim()) continue
+        try {
+          last = JSON.parse(line) as RenderEvent
+          if (onEvent(last)) return finish()
+        } catch (e) {
+          return finish(e as Error)
+        }
+      }
+    })
+    socket.on('error', (e) => finish(e))
+    socket.on('close', () => finish())
+    socket.write(JSON.stringify(message) + '\n')
+  })
+}
+
+/** Queue a render and return its `queued` event (job id and output path). */
+export async function submitJob(data: unknown, options: Record<string, unknown> = {}): Promise<RenderEvent> {
+  const queued = await request({ op: 'submit', data, options }, () => true)
+  if (!queued || queued.event !== 'queued') {
+    throw new Error(queued?.error ?? 'Render service rejected the job')
+  }
+  return queued
+}
+
+/** Current status of a job. */
+export async function jobStatus(job: string): Promise<RenderEvent> {
+  const status = await request({ op: 'status', job }, () => true)
+  if (!status) throw new Error('Render service closed the connection')
+  return status
+}
+
+/** Stream a job's progress events until it is done or failed; resolves with the final one. */
+export function watchJob(
+  job: string,
+  onEvent: (event: RenderEvent) => void = () => {}
+): Promise<RenderEvent | undefined> {
+  return request({ op: 'watch', job }, (event) => {
+    onEvent(event)
+    return event.event !== 'progress'
+  })
+}
+
+/** URL of a finished job's video, served by app/api/renders/[filename]. */
+export function videoUrl(output: string): string {
+  return `/api/renders/${path.basename(output)}`
+}
@@ -0,0 +1,213 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+import timing
+from compositor import Sprite
+
+# ==========================================
+# CONFIGURATION & DEFAULTS
+# ==========================================
+
+DEFAULT_MEMORY_MB = 1024
+DEFAULT_DISK_MB = 2048
+# Memory charged for a cached image header size, so those stay under the cap too
+SIZE_ENTRY_BYTES = 256
+# Bump when decoding or resampling changes so stale .npy files are ignored
+ASSET_CACHE_VERSION = 1
+
+# ==========================================
+# ASSET CACHE
+# ==========================================
+
+
+def contain_fit(img_size, box_size):
+    """Largest (width, height) with the image's aspect ratio inside the box."""
+    img_w, img_h = img_size
+    base_w, base_h = box_size
+    scale_factor = min(base_w / img_w, base_h / img_h)
+    return int(img_w * scale_factor), int(img_h * scale_factor)
+
+class AssetCache:
+    """
+    Decoded assets shared by every object (and, when long-lived, every
+    render) that uses them.
+
+    Each PNG is decoded once per (path, mtime) and each contain-fit size is
+    resampled once per (path, mtime, target size). Objects placing the same
+    image at the same size share one set of pixel buffers. Entries are kept
+    in LRU order and evicted past `max_bytes`.
+
+    With `disk_dir`, resampled pixels are also written as .npy files and
+    memory-mapped on later runs instead of being decoded again. Like the
+    segment cache, the directory is kept under `disk_max_bytes` by evicting
+    least recently used files; a disk hit refreshes their mtime.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_MB * 1024 * 1024, disk_dir=None,
+                 disk_max_bytes=DEFAULT_DISK_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.RLock()
+        self.stats = {"hits": 0, "disk_hits": 0, "decodes": 0, "resizes": 0, "evictions": 0, "disk_evictions": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def sprite(self, path, box_size):
+        """Sprite for `path` contain-fit and centred in a (width, height) box."""
+        st = os.stat(path)
+        file_key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        new_w, new_h = contain_fit(self._image_size(file_key), box_size)
+        pixels = self._resized(file_key, (new_w, new_h))
+
+        base_w, base_h = box_size
+        offset = (int((base_w - new_w) / 2), int((base_h - new_h) / 2))
+        return pixels.placed(offset)
+
+    # Sprite loaders are plain callables
+    __call__ = sprite
+
+    def _get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def _put(self, key, value, nbytes):
+        with self.lock:
+            if key in self.entries:
+                return self.entries[key][0]
+            self.entries[key] = (value, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                _, (_, old_bytes) = self.entries.popitem(last=False)
+                self.bytes -= old_bytes
+                self.stats["evictions"] += 1
+            return value
+
+    def _image_size(self, file_key):
+        """Image dimensions, read from the header without decoding pixels."""
+        key = ("size",) + file_key
+        entry = self._get(key)
+        if entry is not None:
+            return entry[0]
+        with Image.open(file_key[0]) as img:
+            size = img.size
+        return self._put(key, size, SIZE_ENTRY_BYTES)
+
+    def _source(self, file_key):
+        """Decoded RGBA image for a file version."""
+        key = ("source",) + file_key
+        entry = self._get(key)
+        if entry is not None:
+            return entry[0]
+        # convert('RGBA') honours palette PNG `transparency` (e.g.
+        # local_assets/example.png). moviepy ignored it and drew those
+        # pixels as an opaque black box, so such assets render differently.
+        with timing.phase("asset_decode"), Image.open(file_key[0]) as img:
+            img = img.convert('RGBA')
+            img.load()
+        self.stats["decodes"] += 1
+        w, h = img.size
+        return self._put(key, img, w * h * 4)
+
+    def _resized(self, file_key, size):
+        key = ("resized",) + file_key + size
+        entry = self._get(key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            return entry[0]
+
+        sprite = self._load_npy(key)
+        if sprite is None:
+            sprite = self._resample(self._source(file_key), size, file_key[0])
+            self._save_npy(key, sprite)
+        return self._put(key, sprite, sprite.nbytes)
+
+    def _resample(self, source, size, path):
+        # Colour and alpha are resampled separately (straight, not
+        # premultiplied), which is what the moviepy Resize effect did.
+        with timing.phase("asset_resize"):
+            r, g, b, a = source.split()
+            rgb = Image.merge('RGB', (r, g, b)).resize(size, Image.Resampling.LANCZOS)
+            a = a.resize(size, Image.Resampling.LANCZOS)
+            sprite = Sprite(np.asarray(rgb), np.asarray(a), (0, 0), source=path)
+        self.stats["resizes"] += 1
+        return sprite
+
+    def _npy_paths(self, key):
+        digest = hashlib.sha1(repr((ASSET_CACHE_VERSION,) + key).encode()).hexdigest()
+        base = os.path.join(self.disk_dir, digest)
+        return base + ".rgba.npy", base + ".premul.npy"
+
+    def _load_npy(self, key):
+        if not self.disk_dir:
+            return None
+        rgba_path, premul_path = self._npy_paths(key)
+        if not (os.path.exists(rgba_path) and os.path.exists(premul_path)):
+            return None
+        try:
+            with timing.phase("asset_map"):
+                rgba = np.load(rgba_path, mmap_mode='r')
+                premul = np.load(premul_path, mmap_mode='r')
+            # Mark as recently used for disk eviction
+            os.utime(rgba_path)
+            os.utime(premul_path)
+        except (OSError, ValueError):
+            return None
+        self.stats["disk_hits"] += 1
+        return Sprite(rgba[:, :, :3], rgba[:, :, 3:], (0, 0), source=key[1], premul=premul)
+
+    def _save_npy(self, key, sprite):
+        if not self.disk_dir:
+            return
+        rgba_path, premul_path = self._npy_paths(key)
+        rgba = np.concatenate([sprite.rgb, sprite.alpha], axis=2)
+        # Write-then-rename so a concurrent reader never maps a partial file
+        for path, array in ((rgba_path, rgba), (premul_path, sprite.premul)):
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp, path)
+        self.evict_disk(keep=(rgba_path, premul_path))
+
+    def evict_disk(self, keep=()):
+        """
+        Drop least recently used .npy pairs until the disk store fits,
+        sparing `keep`. Already-mapped arrays stay valid after unlinking.
+        """
+        pairs = {}  # digest -> [paths, oldest mtime, bytes]
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".npy"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            pair = pairs.setdefault(name.split(".")[0], [[], st.st_mtime, 0])
+            pair[0].append(path)
+            pair[1] = min(pair[1], st.st_mtime)
+            pair[2] += st.st_size
+        total = sum(size for _, _, size in pairs.values())
+        keep = set(keep)
+        for paths, _, size in sorted(pairs.values(), key=lambda pair: pair[1]):
+            if total <= self.disk_max_bytes:
+                break
+            if keep.intersection(paths):
+                continue
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            self.stats["disk_evictions"] += 1
@@ -0,0 +1,311 @@
+"""
+Render benchmark: synthetic storyboards in the storyboard_data.json schema,
+rendered case by case with the timing hooks on.
+
+    python benchmark.py                          # every case -> benchmark_report.json
+    python benchmark.py --cases baseline,many_objects --repeat 3
+    python benchmark.py --compare old_report.json
+    python benchmark.py --profile profiles/      # cProfile dump per case
+    py-spy record -o render.svg -- python benchmark.py --cases baseline --in-process
+
+Storyboards are generated from a fixed seed, so the same case renders the
+same frames on every commit and reports can be diffed directly. Each case
+runs in a fresh interpreter so its peak RSS is its own; --in-process keeps
+everything in one process for samplers like py-spy (peak RSS is then the
+running maximum). Phase times from segment workers are summed over
+processes, so with --workers they can exceed the wall time.
+"""
+import argparse
+import cProfile
+import json
+import os
+import platform
+import pstats
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+import timing
+from assets import AssetCache
+from render import load_storyboard, render_settings, render_storyboard
+
+# ==========================================
+# CONFIGURATION & DEFAULTS
+# ==========================================
+
+REPORT_VERSION = 1
+DEFAULT_REPORT = "benchmark_report.json"
+SEED = 1234
+STYLES = ("fade_in", "slide_from_bottom", "slide_from_side", "wipe_reveal", "none")
+EVEN_MIX = {style: 1 for style in STYLES}
+
+# stages, objects, asset_px (long side of each source PNG), artboard, style weights;
+# moving=False keeps every object in place in every stage
+CASES = {
+    "baseline":       dict(stages=6,  objects=12, asset_px=512,  artboard=(360, 640),   styles=EVEN_MIX),
+    "many_stages":    dict(stages=24, objects=12, asset_px=512,  artboard=(360, 640),   styles=EVEN_MIX),
+    "many_objects":   dict(stages=6,  objects=60, asset_px=512,  artboard=(360, 640),   styles=EVEN_MIX),
+    "large_assets":   dict(stages=6,  objects=12, asset_px=2048, artboard=(360, 640),   styles=EVEN_MIX),
+    "large_artboard": dict(stages=6,  objects=12, asset_px=1024, artboard=(1080, 1920), styles=EVEN_MIX),
+    "fades":          dict(stages=6,  objects=12, asset_px=512,  artboard=(360, 640),   styles={"fade_in": 1, "wipe_reveal": 1}),
+    "slides":         dict(stages=6,  objects=12, asset_px=512,  artboard=(360, 640),
+                           styles={"slide_from_bottom": 1, "slide_from_side": 1}),
+    "static":         dict(stages=6,  objects=12, asset_px=512,  artboard=(360, 640),   styles={"none": 1},
+                           moving=False),
+}
+# Distinct source images per storyboard; objects beyond this share files
+MAX_ASSET_FILES = 8
+
+# ==========================================
+# SYNTHETIC STORYBOARDS
+# ==========================================
+
+
+def make_asset(path, long_side, rng):
+    """A soft-edged RGBA blob with gradients and noise, so decode and resize do real work."""
+    aspect = rng.uniform(0.5, 2.0)
+    w, h = (long_side, max(1, int(long_side / aspect))) if aspect >= 1 else (max(1, int(long_side * aspect)), long_side)
+    yy, xx = np.mgrid[0:h, 0:w]
+    u, v = xx / max(w - 1, 1), yy / max(h - 1, 1)
+    base = np.array([rng.randint(0, 255) for _ in range(3)], dtype=float)
+    rgb = base + 90 * np.stack([u, v, 1 - u], axis=2) + np.random.default_rng(rng.randint(0, 2**31)).normal(0, 12, (h, w, 3))
+    dist = np.hypot(u - 0.5, v - 0.5) * 2
+    alpha = np.clip((1.0 - dist) * 4, 0, 1) * 255
+    rgba = np.dstack([np.clip(rgb, 0, 255), alpha]).astype(np.uint8)
+    Image.fromarray(rgba).save(path)
+
+def make_storyboard(case, assets_dir, seed=SEED):
+    """
+    Storyboard dict for a CASES entry, writing its source PNGs to `assets_dir`.
+    Objects come and go between stages, move around the artboard and pick
+    their entrance style from the case's weighted mix; with moving=False
+    they stay put in every stage instead, so frames can be reused.
+    """
+    rng = random.Random(seed)
+    os.makedirs(assets_dir, exist_ok=True)
+    width, height = case['artboard']
+
+    filenames = []
+    for k in range(min(case['objects'], MAX_ASSET_FILES)):
+        filename = f"bench-{k}.png"
+        make_asset(os.path.join(assets_dir, filename), case['asset_px'], rng)
+        filenames.append(filename)
+
+    styles, weights = zip(*case['styles'].items())
+    objects = []
+    for k in range(case['objects']):
+        box = rng.uniform(0.1, 0.45) * width
+        objects.append({
+            'id': f"obj-{k}",
+            'filename': filenames[k % len(filenames)],
+            'size': {'width': round(box), 'height': round(box * rng.uniform(0.6, 1.6))},
+            'animationStyle': rng.choices(styles, weights)[0],
+            'layerOrder': rng.randint(0, 5),
+        })
+
+    def place():
+        return {'x': rng.randint(-20, width - 20), 'y': rng.randint(-20, height - 20)}
+
+    moving = case.get('moving', True)
+    homes = {} if moving else {obj['id']: place() for obj in objects}
+    stages = []
+    for s in range(case['stages']):
+        assets = []
+        for obj in objects:
+            if not moving:
+                assets.append(dict(obj, position=homes[obj['id']], rotation=0))
+            elif rng.random() < 0.7:
+                assets.append(dict(obj, position=place(), rotation=0))
+        stages.append({'id': f"stage-{s + 1}", 'name': f"Stage {s + 1}", 'assets': assets})
+
+    return {'version': "1.0", 'artboard': {'width': width, 'height': height}, 'stages': stages}
+
+# ==========================================
+# RUNNING CASES
+# ==========================================
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident set size in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def run_case(name, work_dir, workers=1, preview=False, profile_dir=None):
+    """Generate and render one case in this process; returns its result dict."""
+    case = CASES[name]
+    case_dir = os.path.join(work_dir, name)
+    assets_dir = os.path.join(case_dir, "assets")
+    data_path = os.path.join(case_dir, "storyboard_data.json")
+    output = os.path.join(case_dir, "render.mp4")
+    os.makedirs(case_dir, exist_ok=True)
+    with open(data_path, 'w') as f:
+        json.dump(make_storyboard(case, assets_dir), f)
+
+    scale, fps, preset = render_settings(preview)
+    profiler = cProfile.Profile() if profile_dir else None
+    timing.reset()
+    timing.enable()
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    data = load_storyboard(data_path)
+    compositor = render_storyboard(data, output, workers, assets=AssetCache(), verbose=False,
+                                   scale=scale, fps=fps, preset=preset, assets_dir=assets_dir)
+    if profiler:
+        profiler.disable()
+    wall = time.perf_counter() - start
+    timing.enable(False)
+
+    if profiler:
+        os.makedirs(profile_dir, exist_ok=True)
+        prof_path = os.path.join(profile_dir, f"{name}.prof")
+        profiler.dump_stats(prof_path)
+        print(f"--- {name}: top functions by cumulative time ({prof_path}) ---", file=sys.stderr)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(15)
+
+    timeline = compositor.timeline
+    return {
+        'params': dict(case, artboard=list(case['artboard'])),
+        'video_size': list(timeline.video_size),
+        'frames': timeline.n_frames,
+        'wall_seconds': round(wall, 3),
+        'fps': round(timeline.n_frames / wall, 2),
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_child_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+        'output_bytes': os.path.getsize(output),
+        'phases': timing.snapshot(),
+        'redraws': dict(compositor.stats),
+    }
+
+def run_case_isolated(name, work_dir, args):
+    """Run one case in a fresh interpreter so peak RSS isn't shared between cases."""
+    result_path = os.path.join(work_dir, f"{name}.result.json")
+    cmd = [sys.executable, os.path.abspath(__file__), "--run-case", name, "--result", result_path,
+           "--work-dir", work_dir, "--workers", str(args.workers)]
+    if args.preview:
+        cmd.append("--preview")
+    if args.profile:
+        cmd += ["--profile", args.profile]
+    subprocess.run(cmd, check=True, stdout=None if args.verbose else subprocess.DEVNULL)
+    with open(result_path) as f:
+        return json.load(f)
+
+def best_of(runs):
+    """Fastest of repeated runs; peak RSS is the worst seen."""
+    best = dict(min(runs, key=lambda r: r['wall_seconds']))
+    best['peak_rss_mb'] = max(r['peak_rss_mb'] for r in runs)
+    best['peak_child_rss_mb'] = max(r['peak_child_rss_mb'] for r in runs)
+    best['runs'] = len(runs)
+    return best
+
+# ==========================================
+# REPORTING
+# ==========================================
+
+
+def environment():
+    """Where the numbers came from: commit, interpreter and library versions."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    import PIL
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pillow': PIL.__version__,
+    }
+
+def print_summary(report, baseline=None):
+    base_cases = (baseline or {}).get('cases', {})
+    if baseline:
+        ignore = ('repeat',)
+        ours = {k: v for k, v in report['settings'].items() if k not in ignore}
+        theirs = {k: v for k, v in baseline.get('settings', {}).items() if k not in ignore}
+        if ours != theirs:
+            print(f"Warning: baseline settings differ ({theirs} vs {ours}); fps changes are not like for like.")
+    print(f"{'case':<16} {'frames':>6} {'wall s':>8} {'fps':>8} {'rss MB':>8}  top phases")
+    for name, result in report['cases'].items():
+        phases = sorted(result['phases'].items(), key=lambda item: -item[1]['seconds'])[:3]
+        top = ", ".join(f"{phase} {entry['seconds']:.2f}s" for phase, entry in phases)
+        line = (f"{name:<16} {result['frames']:>6} {result['wall_seconds']:>8.2f} "
+                f"{result['fps']:>8.2f} {result['peak_rss_mb']:>8.1f}  {top}")
+        if name in base_cases:
+            change = (result['fps'] / base_cases[name]['fps'] - 1) * 100
+            line += f"  [fps {change:+.1f}% vs {baseline['environment'].get('commit')}]"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the storyboard renderer on synthetic storyboards.')
+    parser.add_argument('--cases', type=str, default=",".join(CASES), help=f'Comma-separated cases: {", ".join(CASES)}')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per case; the fastest is reported')
+    parser.add_argument('--workers', type=int, default=1, help='Segment workers per render')
+    parser.add_argument('--preview', action='store_true', help='Benchmark draft-preview settings')
+    parser.add_argument('--report', type=str, default=DEFAULT_REPORT, help='Where to write the JSON report')
+    parser.add_argument('--compare', type=str, default=None, help='Earlier report to compare fps against')
+    parser.add_argument('--profile', type=str, default=None, metavar='DIR', help='Write a cProfile dump per case to DIR')
+    parser.add_argument('--in-process', action='store_true', help='Run every case in this process (for py-spy)')
+    parser.add_argument('--work-dir', type=str, default=None, help='Keep generated storyboards and renders here')
+    parser.add_argument('--verbose', action='store_true', help='Show the renderer output')
+    parser.add_argument('--run-case', type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--result', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Child mode: one case, result written for the parent to collect
+    if args.run_case:
+        result = run_case(args.run_case, args.work_dir, args.workers, args.preview, args.profile)
+        with open(args.result, 'w') as f:
+            json.dump(result, f)
+        return
+
+    names = [name.strip() for name in args.cases.split(",") if name.strip()]
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="render-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    report = {
+        'version': REPORT_VERSION,
+        'environment': environment(),
+        'settings': {'workers': args.workers, 'preview': args.preview, 'repeat': args.repeat, 'seed': SEED},
+        'cases': {},
+    }
+    try:
+        for name in names:
+            runs = []
+            for _ in range(max(1, args.repeat)):
+                if args.in_process:
+                    runs.append(run_case(name, work_dir, args.workers, args.preview, args.profile))
+                else:
+                    runs.append(run_case_isolated(name, work_dir, args))
+            report['cases'][name] = best_of(runs)
+            print(f"DEBUG: {name}: {report['cases'][name]['fps']} fps", file=sys.stderr)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_summary(report, baseline)
+    print(f"Report written to {args.report}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import os
+import subprocess
+import tempfile
+
+from imageio_ffmpeg import count_frames_and_secs
+from moviepy.config import FFMPEG_BINARY
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from PIL import Image
+
+import timing
+
+# ==========================================
+# ENCODING
+# ==========================================
+
+# Same defaults moviepy's write_videofile picks for .mp4. Every segment of a
+# parallel render must use identical settings or the concat copy breaks.
+CODEC = "libx264"
+PRESET = "medium"
+# Draft previews trade compression for encode speed
+PREVIEW_PRESET = "ultrafast"
+
+
+def encode_frames(compositor, frames, path, fps, codec=CODEC, preset=PRESET, progress=None):
+    """
+    Composite the given frame indices and pipe them into one video file.
+    `progress(n)`, if given, is called with the number of frames just written.
+    """
+    timeline = compositor.timeline
+    writer = FFMPEG_VideoWriter(path, timeline.video_size, fps, codec=codec, preset=preset)
+    try:
+        for i in frames:
+            frame = compositor.render(i)
+            with timing.phase("encode"):
+                writer.write_frame(frame)
+            if progress:
+                progress(1)
+    finally:
+        # Closing waits for ffmpeg to flush the frames still in its pipeline
+        with timing.phase("encode"):
+            writer.close()
+
+def concat_segments(paths, output):
+    """Join encoded segments with ffmpeg's concat demuxer, without re-encoding."""
+    fd, list_path = tempfile.mkstemp(suffix=".txt", dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        with os.fdopen(fd, "w") as f:
+            for path in paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        cmd = [
+            FFMPEG_BINARY, "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-c", "copy", output,
+        ]
+        with timing.phase("concat"):
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    finally:
+        os.remove(list_path)
+
+def probe_video(path):
+    """(frame count, duration in seconds) of an encoded video, by decoding it."""
+    return count_frames_and_secs(path)
+
+# ==========================================
+# STILLS
+# ==========================================
+
+STILL_FORMATS = {"png": "PNG", "jpg": "JPEG"}
+JPEG_QUALITY = 90
+
+
+def write_stills(compositor, stage_indices, out_dir, fmt="png"):
+    """
+    Write one poster image per stage (stage_01.png, ...) showing every object
+    at its keyframe with its entrance finished. Returns the written paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    timeline = compositor.timeline
+    options = {"quality": JPEG_QUALITY} if fmt == "jpg" else {}
+    paths = []
+    for k in stage_indices:
+        frame = compositor.draw(timeline.stage_pose(k)[compositor.rows])
+        path = os.path.join(out_dir, f"stage_{k + 1:02d}.{fmt}")
+        Image.fromarray(frame).save(path, STILL_FORMATS[fmt], **options)
+        paths.append(path)
+    return paths
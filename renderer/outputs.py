@@ -0,0 +1,173 @@
+import os
+import queue
+import threading
+from dataclasses import dataclass
+
+from moviepy.tools import extensions_dict
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+import timing
+from encode import CODEC, PRESET
+
+# ==========================================
+# OUTPUT TARGETS
+# ==========================================
+
+# Master frames buffered per output; bounds memory while letting a briefly
+# slow encoder fall behind without holding up the others
+QUEUE_FRAMES = 16
+# Seconds between checks that a blocked output is still alive
+PUT_TIMEOUT = 0.5
+
+
+@dataclass
+class OutputTarget:
+    """One file to encode from the shared composition pass."""
+    path: str
+    size: tuple
+    fps: int
+    codec: str
+
+def default_codec(path):
+    """moviepy's codec for a file extension, or CODEC if it has none."""
+    ext = os.path.splitext(path)[1].lstrip('.').lower()
+    return extensions_dict.get(ext, {}).get('codec', [CODEC])[0]
+
+def even_size(width, height):
+    """Nearest even (width, height), at least 2x2: yuv420p encoders need even sides."""
+    return max(2, int(round(width / 2)) * 2), max(2, int(round(height / 2)) * 2)
+
+def parse_output_spec(spec, master_size, master_fps):
+    """
+    'PATH[:SIZE][:FPS][:CODEC]' -> OutputTarget. SIZE is WxH, or Np for an
+    N-pixel short side at the master's aspect ratio (e.g. 720p), rounded to
+    even dimensions either way; FPS must not exceed the master's. Omitted
+    fields follow the master render and the codec follows the file extension.
+    """
+    path, *fields = spec.split(':')
+    size, fps, codec = tuple(master_size), master_fps, None
+    for field in fields:
+        if 'x' in field and field.replace('x', '').isdigit():
+            width, height = field.split('x')
+            size = even_size(int(width), int(height))
+        elif field.endswith('p') and field[:-1].isdigit():
+            short, (width, height) = int(field[:-1]), master_size
+            factor = short / min(width, height)
+            size = even_size(width * factor, height * factor)
+        elif field.isdigit():
+            fps = int(field)
+        elif field:
+            codec = field
+    if not path:
+        raise ValueError(f"Output {spec!r} has no file name")
+    if fps > master_fps or fps <= 0:
+        raise ValueError(f"Output {spec!r}: fps must be between 1 and the master's {master_fps}")
+    return OutputTarget(path, size, fps, codec or default_codec(path))
+
+class _OutputPipe:
+    """
+    Encoder thread for one target: takes master frames off a bounded queue
+    and writes them to its own ffmpeg process. Pipe writes release the GIL,
+    so the pipes run alongside compositing.
+
+    Downscaling happens inside that ffmpeg process (swscale, area filter)
+    as part of its RGB to YUV conversion: cheaper than the conversion alone
+    at master size, and off the compositing process entirely.
+    """
+
+    def __init__(self, target, master_size, preset):
+        self.target = target
+        self.master_size = tuple(master_size)
+        self.preset = preset
+        self.queue = queue.Queue(maxsize=QUEUE_FRAMES)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, frame):
+        while True:
+            try:
+                self.queue.put(frame, timeout=PUT_TIMEOUT)
+                return
+            except queue.Full:
+                if not self.thread.is_alive():
+                    raise RuntimeError(f"Encoder for {self.target.path} failed: {self.error}")
+
+    def close(self):
+        if self.thread.is_alive():
+            self.put(None)
+        self.thread.join()
+        if self.error:
+            raise RuntimeError(f"Encoder for {self.target.path} failed: {self.error}")
+
+    def _run(self):
+        target = self.target
+        params = None
+        if tuple(target.size) != self.master_size:
+            params = ["-vf", f"scale={target.size[0]}:{target.size[1]}:flags=area"]
+        try:
+            with FFMPEG_VideoWriter(target.path, self.master_size, target.fps, codec=target.codec,
+                                    preset=self.preset, ffmpeg_params=params) as writer:
+                while True:
+                    frame = self.queue.get()
+                    if frame is None:
+                        return
+                    with timing.phase("encode"):
+                        writer.write_frame(frame)
+        except Exception as e:
+            self.error = e
+
+def decimated_frames(target, master_fps, n_frames, frames=None):
+    """
+    Master frame indices a target needs: its frame j is master frame
+    j * master_fps // fps, i.e. the master frame shown at the target's time
+    t = j / fps. `frames` limits them to a (start, stop) slice.
+    """
+    start, stop = frames or (0, n_frames)
+    duration = n_frames / master_fps
+    needed = ((j * master_fps) // target.fps for j in range(int(duration * target.fps)))
+    return sorted({i for i in needed if start <= i < stop})
+
+def render_outputs(compositor, targets, preset=PRESET, progress=None, frames=None):
+    """
+    Composite the timeline once at master resolution and fan each frame out
+    to every target that needs it, each encoding on its own thread from a
+    bounded queue. Master frames no target needs are skipped. `progress(n)`
+    counts master frames of the (start, stop) `frames` slice.
+
+    If any output fails, the others are closed and every target file is
+    removed, so a half-written file is never mistaken for a finished one.
+    """
+    timeline = compositor.timeline
+    start, stop = frames or (0, timeline.n_frames)
+    wanted = [set(decimated_frames(t, timeline.fps, timeline.n_frames, (start, stop))) for t in targets]
+
+    for target in targets:
+        print(f"DEBUG: Output {target.path}: {target.size[0]}x{target.size[1]} @ {target.fps} fps, {target.codec}")
+    pipes = [_OutputPipe(target, timeline.video_size, preset) for target in targets]
+    finished = False
+    try:
+        for i in range(start, stop):
+            receivers = [pipe for pipe, needed in zip(pipes, wanted) if i in needed]
+            if receivers:
+                # The compositor reuses its buffer; pipes share one read-only copy
+                frame = compositor.render(i).copy()
+                for pipe in receivers:
+                    pipe.put(frame)
+            if progress:
+                progress(1)
+        finished = True
+    finally:
+        errors = []
+        for pipe in pipes:
+            try:
+                pipe.close()
+            except RuntimeError as e:
+                errors.append(str(e))
+        if errors or not finished:
+            for target in targets:
+                if os.path.exists(target.path):
+                    os.remove(target.path)
+                    print(f"DEBUG: Removed partial output {target.path}")
+        if errors:
+            raise RuntimeError("; ".join(errors))
@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import timing
+from assets import DEFAULT_DISK_MB, AssetCache
+from encode import PRESET, concat_segments, encode_frames, probe_video
+from scene import build_compositor
+
+# ==========================================
+# PARALLEL SEGMENT RENDERING
+# ==========================================
+
+# Per-process compositor, built once by the pool initializer
+_worker_compositor = None
+
+
+def split_frame_ranges(n_frames, workers, frames_per_stage):
+    """
+    Cut [0, n_frames) into at most `workers` contiguous (start, stop) ranges.
+
+    Cuts land on stage boundaries when there are enough stages to go round,
+    otherwise on plain frame boundaries.
+    """
+    workers = max(1, min(workers, n_frames))
+    unit = frames_per_stage if frames_per_stage and n_frames // frames_per_stage >= workers else 1
+    units = -(-n_frames // unit)
+    ranges = []
+    for k in range(workers):
+        start = min(units * k // workers * unit, n_frames)
+        stop = min(units * (k + 1) // workers * unit, n_frames)
+        if stop > start:
+            ranges.append((start, stop))
+    return ranges
+
+def _init_worker(scene):
+    global _worker_compositor
+    # Forked workers inherit the parent's totals; count only their own work
+    timing.reset()
+    timing.enable(scene.get('timing', False))
+    assets = AssetCache(disk_dir=scene.get('asset_cache_dir'),
+                        disk_max_bytes=scene.get('asset_cache_bytes', DEFAULT_DISK_MB * 1024 * 1024))
+    _worker_compositor = build_compositor(
+        scene['data'], scene['assets_dir'], scene['fps'], scene['stage_duration'],
+        verbose=False, load=assets,
+        scale=scene.get('scale'),
+    )
+
+def _render_segment(job):
+    start, stop, path, fps, preset = job
+    encode_frames(_worker_compositor, range(start, stop), path, fps, preset=preset)
+    # Hand this process's phase times (set-up included) back to the parent
+    timings = timing.snapshot()
+    timing.reset()
+    return start, stop, path, timings
+
+def render_segments(jobs, workers, compositor, scene, progress=None):
+    """
+    Encode (start, stop, path) jobs. With more than one worker they run in a
+    process pool where each process rebuilds the compositor from `scene`
+    (the build_compositor arguments, encoder preset and an optional shared
+    `asset_cache_dir`); otherwise they run here on `compositor`.
+    `progress(n)` is told about finished frames: one at a time when serial,
+    a whole segment at a time from the pool.
+    """
+    fps = scene['fps']
+    preset = scene.get('preset', PRESET)
+    if workers <= 1 or len(jobs) <= 1:
+        for done, (start, stop, path) in enumerate(jobs, 1):
+            encode_frames(compositor, range(start, stop), path, fps, preset=preset, progress=progress)
+            print(f"DEBUG: Segment frames {start}-{stop - 1} done ({done}/{len(jobs)})")
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(jobs)),
+        initializer=_init_worker,
+        initargs=(scene,),
+    ) as pool:
+        futures = [pool.submit(_render_segment, (start, stop, path, fps, preset)) for start, stop, path in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            start, stop, _, timings = future.result()
+            timing.merge(timings)
+            print(f"DEBUG: Segment frames {start}-{stop - 1} done ({done}/{len(jobs)})")
+            if progress:
+                progress(stop - start)
+
+def render_parallel(compositor, scene, output, workers, progress=None, frames=None):
+    """
+    Render contiguous frame ranges in a process pool, one encoded segment per
+    range, then stitch the segments into `output` without re-encoding.
+    `frames` limits the render to a (start, stop) slice of the timeline.
+    """
+    first, last = frames or (0, compositor.timeline.n_frames)
+    n_frames = last - first
+    ranges = [
+        (first + start, first + stop)
+        for start, stop in split_frame_ranges(n_frames, workers, int(round(scene['stage_duration'] * scene['fps'])))
+    ]
+    segment_dir = tempfile.mkdtemp(prefix="segments-", dir=os.path.dirname(os.path.abspath(output)))
+    ext = os.path.splitext(output)[1] or ".mp4"
+    jobs = [
+        (start, stop, os.path.join(segment_dir, f"segment_{k:04d}{ext}"))
+        for k, (start, stop) in enumerate(ranges)
+    ]
+    print(f"DEBUG: Rendering {n_frames} frames as {len(jobs)} segments on {workers} workers...")
+    try:
+        render_segments(jobs, workers, compositor, scene, progress)
+        print(f"Concatenating {len(jobs)} segments...")
+        concat_segments([path for _, _, path in jobs], output)
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+def verify_against_serial(compositor, frames, fps, output, preset=PRESET):
+    """
+    Render the same `frames` serially and check the parallel `output` has the
+    same frame count and duration. Returns True when they match.
+    """
+    fd, serial_path = tempfile.mkstemp(suffix=os.path.splitext(output)[1] or ".mp4",
+                                       dir=os.path.dirname(os.path.abspath(output)))
+    os.close(fd)
+    try:
+        print("Verifying against a serial render...")
+        compositor.reset()
+        encode_frames(compositor, frames, serial_path, fps, preset=preset)
+        serial = probe_video(serial_path)
+        parallel = probe_video(output)
+    finally:
+        os.remove(serial_path)
+
+    print(f"DEBUG: serial {serial[0]} frames / {serial[1]:.3f}s, parallel {parallel[0]} frames / {parallel[1]:.3f}s")
+    if serial != parallel:
+        print("Error: parallel render does not match the serial render.")
+        return False
+    print("Parallel render matches the serial render.")
+    return True
@@ -4,10 +4,14 @@ import os
 import argparse
 import sys
 import traceback
-from moviepy import *
-from moviepy.video.VideoClip import ImageClip, ColorClip
-from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
-from moviepy.video.fx import Resize
+
+import timing
+from assets import DEFAULT_DISK_MB, DEFAULT_MEMORY_MB, AssetCache
+from encode import PRESET, PREVIEW_PRESET, STILL_FORMATS, encode_frames, write_stills
+from outputs import parse_output_spec, render_outputs
+from parallel import render_parallel, verify_against_serial
+from scene import build_compositor
+from segment_cache import SegmentCache, render_cached
 
 # ==========================================
 # CONFIGURATION & DEFAULTS
@@ -18,32 +22,167 @@ DEFAULT_OUTPUT_FILE = "final_render.mp4"
 ASSETS_DIR = "local_assets"
 TRANSITION_DURATION = 2.0
 FPS = 30
+DEFAULT_CACHE_MB = 2048
+
+# Draft previews: artboard-sized frames at half the frame rate
+PREVIEW_SCALE = 1
+PREVIEW_FPS = 15
+
+
+def load_storyboard(path):
+    """Parse a storyboard JSON export."""
+    with timing.phase("json_load"), open(path, 'r') as f:
+        return json.load(f)
+
+def render_settings(preview=False, scale=None, fps=None):
+    """
+    (scale, fps, preset) for a final render or a draft preview. A scale of
+    None keeps the artboard-dependent default.
+    """
+    if preview:
+        return scale or PREVIEW_SCALE, fps or PREVIEW_FPS, PREVIEW_PRESET
+    return scale, fps or FPS, PRESET
+
+def parse_frame_range(text):
+    """'a:b' -> (a, b); either end may be left empty."""
+    start, sep, stop = text.partition(':')
+    if not sep:
+        raise argparse.ArgumentTypeError("expected a:b")
+    try:
+        return (int(start) if start else None, int(stop) if stop else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid frame range {text!r}")
+
+def select_frames(timeline, stage=None, frame_range=None):
+    """
+    (start, stop) output frames to render: one stage's slot for a 1-based
+    `stage` (as numbered in the editor), an (a, b) `frame_range`, or the
+    whole timeline. Frames keep their time positions, t = i / fps.
+    """
+    if stage is not None:
+        if not 1 <= stage <= len(timeline.stages):
+            raise ValueError(f"Stage {stage} out of range (1-{len(timeline.stages)})")
+        return timeline.stage_frames(stage - 1)
+    start, stop = frame_range or (None, None)
+    start = 0 if start is None else max(start, 0)
+    stop = timeline.n_frames if stop is None else min(stop, timeline.n_frames)
+    if start >= stop:
+        raise ValueError(f"Empty frame range {start}:{stop} ({timeline.n_frames} frames)")
+    return start, stop
+
+def render_storyboard(data, output, workers=1, cache_dir=None, cache_size=DEFAULT_CACHE_MB,
+                      progress=None, assets=None, verbose=True, scale=None, fps=FPS,
+                      preset=PRESET, stage=None, frame_range=None, assets_dir=ASSETS_DIR, outputs=None):
+    """
+    Render a parsed storyboard to `output`. `progress(done, total)` is called
+    as frames are finished; `assets` is the AssetCache to load sprites from.
+    `scale`, `fps` and `preset` come from render_settings; `stage` or
+    `frame_range` limit the render to a slice (see select_frames).
+    `outputs` is a list of 'PATH[:SIZE][:FPS][:CODEC]' specs encoded from
+    one serial composition pass instead of `output` (see parse_output_spec).
+    Returns the Compositor used for the render.
+    """
+    assets = assets or AssetCache()
+    compositor = build_compositor(data, assets_dir, fps, TRANSITION_DURATION, verbose=verbose, load=assets, scale=scale)
+    timeline = compositor.timeline
+    start, stop = select_frames(timeline, stage, frame_range)
+    scene = {
+        'data': data,
+        'assets_dir': assets_dir,
+        'fps': fps,
+        'stage_duration': TRANSITION_DURATION,
+        'scale': scale,
+        'preset': preset,
+        'asset_cache_dir': assets.disk_dir,
+        'asset_cache_bytes': assets.disk_max_bytes,
+        'timing': timing.enabled(),
+    }
+
+    done = [0]
+    def report(n):
+        done[0] += n
+        progress(done[0], stop - start)
+    advance = report if progress else None
+    if progress:
+        progress(0, stop - start)
+
+    if outputs:
+        targets = [parse_output_spec(spec, timeline.video_size, fps) for spec in outputs]
+        output = ", ".join(target.path for target in targets)
+    if (start, stop) == (0, timeline.n_frames):
+        print(f"Rendering to {output} ({timeline.total_duration}s)...")
+    else:
+        print(f"Rendering frames {start}-{stop - 1} ({start / fps:.2f}s-{stop / fps:.2f}s) to {output}...")
+    if outputs:
+        print(f"Compositing once at {timeline.video_size[0]}x{timeline.video_size[1]} for {len(targets)} outputs...")
+        render_outputs(compositor, targets, preset, advance, (start, stop))
+    elif cache_dir:
+        ext = os.path.splitext(output)[1] or ".mp4"
+        cache = SegmentCache(cache_dir, cache_size * 1024 * 1024, ext)
+        render_cached(compositor, scene, output, workers, cache, advance, (start, stop))
+    elif workers > 1:
+        render_parallel(compositor, scene, output, workers, advance, (start, stop))
+    else:
+        print("Compositing...")
+        encode_frames(compositor, range(start, stop), output, fps, preset=preset, progress=advance)
+        stats = compositor.stats
+        print(f"DEBUG: Frames redrawn full={stats['full']} partial={stats['partial']} reused={stats['reused']}, static underlay built {stats['underlay_builds']}x")
+    return compositor
+
+def print_timings():
+    """Per-phase totals collected by the timing hooks."""
+    for name, entry in timing.snapshot().items():
+        print(f"DEBUG: {name:<13} {entry['seconds']:9.3f}s  {entry['calls']:>6} calls")
+
+def render_stills(data, out_dir, fmt="png", stage=None, scale=None, assets=None, verbose=True,
+                  assets_dir=ASSETS_DIR):
+    """
+    Write a poster image for every stage (or just the 1-based `stage`) to
+    `out_dir`, without encoding any video. Sprites are loaded from
+    `assets_dir`. Returns the written paths.
+    """
+    # Stills show each stage at rest, so the frame rate doesn't affect them
+    compositor = build_compositor(data, assets_dir, FPS, TRANSITION_DURATION, verbose=verbose,
+                                  load=assets or AssetCache(), scale=scale)
+    n_stages = len(compositor.timeline.stages)
+    if stage is not None and not 1 <= stage <= n_stages:
+        raise ValueError(f"Stage {stage} out of range (1-{n_stages})")
+    stages = [stage - 1] if stage is not None else range(n_stages)
+    print(f"Writing {len(stages)} stills to {out_dir}...")
+    return write_stills(compositor, stages, out_dir, fmt)
 
-# ==========================================
-# ANIMATION LIBRARY
-# ==========================================
-
-
-def ease_out_cubic(t):
-    """Math helper: Makes movement fast at start, slow at end."""
-    return 1 - pow(1 - t, 3)
-
-def get_obj_state(stage_data, obj_id):
-    """Find object data by ID in a specific stage list."""
-    assets_list = stage_data
-    if isinstance(stage_data, dict):
-        assets_list = stage_data.get('assets', [])
-    for item in assets_list:
-        if item["id"] == obj_id:
-            return item
-    return None
 
 def main():
     # 1. Parse Arguments
     parser = argparse.ArgumentParser(description='Render storyboard video.')
     parser.add_argument('--input', type=str, default=DEFAULT_JSON_FILE, help='Path to input JSON file')
     parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT_FILE, help='Path to output MP4 file')
+    parser.add_argument('--workers', type=int, default=1, help='Render segments in N processes and concatenate them')
+    parser.add_argument('--verify', action='store_true', help='With --workers, check the result against a serial render')
+    parser.add_argument('--cache-dir', type=str, default=None, help='Reuse encoded stage segments from this directory')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_MB, help='Segment cache size limit in MB')
+    parser.add_argument('--asset-cache', type=str, default=None, help='Keep resized assets as memory-mapped .npy files here')
+    parser.add_argument('--asset-memory', type=int, default=DEFAULT_MEMORY_MB, help='Decoded asset memory limit in MB')
+    parser.add_argument('--asset-cache-size', type=int, default=DEFAULT_DISK_MB, help='Asset .npy store size limit in MB')
+    parser.add_argument('--preview', action='store_true',
+                        help=f'Fast draft: scale {PREVIEW_SCALE}, {PREVIEW_FPS} fps, {PREVIEW_PRESET} encoder preset')
+    parser.add_argument('--scale', type=float, default=None, help='Output pixels per artboard pixel (default: 3 under 500px wide, else 1)')
+    parser.add_argument('--fps', type=int, default=None, help=f'Frame rate (default: {FPS}, or {PREVIEW_FPS} with --preview)')
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument('--stage', type=int, default=None, help='Render only stage K (numbered from 1, as in the editor)')
+    selection.add_argument('--frame-range', type=parse_frame_range, default=None,
+                           help='Render only output frames a to b-1 (either end may be omitted)')
+    parser.add_argument('--stills', type=str, default=None, metavar='DIR',
+                        help='Write one poster image per stage to DIR instead of a video')
+    parser.add_argument('--still-format', choices=sorted(STILL_FORMATS), default='png', help='Image format for --stills')
+    parser.add_argument('--timings', action='store_true', help='Print time spent per render phase')
+    parser.add_argument('--outputs', type=str, nargs='+', default=None, metavar='PATH[:SIZE][:FPS][:CODEC]',
+                        help='Encode several files from one composition pass, e.g. '
+                             'master.mp4 social.mp4:720p web.webm:360x640:15 (SIZE is WxH or Np)')
     args = parser.parse_args()
+    if args.outputs and (args.workers > 1 or args.cache_dir or args.stills):
+        parser.error("--outputs composites in one pass; it can't be combined with --workers, --cache-dir or --stills")
+    timing.enable(args.timings)
 
     JSON_FILE = args.input
     OUTPUT_FILE = args.output
@@ -54,197 +193,38 @@ def main():
 
     # 2. Load Data
     try:
-        with open(JSON_FILE, 'r') as f:
-            data = json.load(f)
-        
+        data = load_storyboard(JSON_FILE)
+
         stages = data['stages']
         if not stages:
             print("No stages found.")
             return
             
-        res = data.get('artboard', {'width': 360, 'height': 640})
-        
-        # Scale logic
-        SCALE = 1
-        if res['width'] < 500: SCALE = 3
-        VIDEO_SIZE = (res['width'] * SCALE, res['height'] * SCALE)
-        print(f"Rendering at {VIDEO_SIZE}")
-        
-        # Collect IDs
-        all_obj_ids = set()
-        for stage in stages:
-            assets = stage.get('assets', []) if isinstance(stage, dict) else stage
-            for obj in assets:
-                all_obj_ids.add(obj['id'])
-        
-        print(f"DEBUG: Found {len(all_obj_ids)} unique objects.")
-        
-        clips = []
-
-        # Background
-        # Each stage gets TRANSITION_DURATION seconds
-        total_duration = len(stages) * TRANSITION_DURATION
-        if total_duration == 0: total_duration = 2.0
-        
-        print(f"DEBUG: Creating background for {total_duration}s...")
-        bg = ColorClip(size=VIDEO_SIZE, color=(255, 255, 255)).with_duration(total_duration)
-        clips.append(bg)
-
-        # 3. Process Objects
-        print(f"DEBUG: Processing objects...")
-        
-        for obj_id in all_obj_ids:
-            # --- STAGE VISIBILITY: Find which stages this object appears in ---
-            stage_indices = [i for i, s in enumerate(stages) if get_obj_state(s, obj_id)]
-            
-            if not stage_indices:
-                continue
-            
-            first_stage_idx = min(stage_indices)
-            last_stage_idx = max(stage_indices)
-            
-            # Calculate timing
-            start_time = first_stage_idx * TRANSITION_DURATION
-            end_time = (last_stage_idx + 1) * TRANSITION_DURATION
-            if end_time > total_duration:
-                end_time = total_duration
-            obj_duration = end_time - start_time
-            
-            if obj_duration <= 0:
-                continue
-
-            # Find first occurrence to get filename/style
-            first_state = get_obj_state(stages[first_stage_idx], obj_id)
-            if not first_state: continue
-
-            filename = first_state.get('filename')
-            if not filename:
-                 print(f"Warning: Object {obj_id} has no filename.")
-                 continue
-            
-            # Handle API URLs (e.g. /api/images/foo.png -> foo.png)
-            filename = os.path.basename(filename)
-                
-            path = os.path.join(ASSETS_DIR, filename)
-            if not os.path.exists(path):
-                print(f"Warning: Asset {filename} not found at {path}")
-                continue
-
-            # Load image
-            img_clip = ImageClip(path)
-
-            def get_pos(state):
-                if 'position' in state:
-                    return state['position']['x'] * SCALE, state['position']['y'] * SCALE
-                return state['x'] * SCALE, state['y'] * SCALE
-
-            def get_size(state):
-                if 'size' in state:
-                    return state['size']['width'] * SCALE, state['size']['height'] * SCALE
-                return state['width'] * SCALE, state['height'] * SCALE
-
-            base_w, base_h = get_size(first_state)
-            
-            # --- RESIZE LOGIC (CONTAIN) ---
-            img_w, img_h = img_clip.size
-            scale_factor = min(base_w / img_w, base_h / img_h)
-            new_w = int(img_w * scale_factor)
-            new_h = int(img_h * scale_factor)
-            
-            img_content = img_clip.with_effects([Resize(new_size=(new_w, new_h))])
-            img_content = img_content.with_duration(obj_duration)
-            
-            img_clip = CompositeVideoClip([img_content.with_position("center")], size=(base_w, base_h))
-            img_clip = img_clip.with_duration(obj_duration)
-            
-            anim_style = first_state.get('animationStyle', 'fade_in')
-
-            # --- DYNAMIC POSITION LOGIC (adjusted for object's start_time) ---
-            def make_pos_func(oid, stages_list, dur_per_stage, style, obj_start_time, first_idx):
-                def pos(t):
-                    # Adjust t to be relative to the full video timeline
-                    global_t = t + obj_start_time
-                    
-                    # A. Base Keyframe Interpolation
-                    segment_idx = int(global_t // dur_per_stage)
-                    
-                    if segment_idx >= len(stages_list) - 1:
-                        last_state = get_obj_state(stages_list[-1], oid)
-                        base_x, base_y = get_pos(last_state) if last_state else (-1000, -1000)
-                    else:
-                        segment_t = global_t % dur_per_stage
-                        progress = segment_t / dur_per_stage
-                        
-                        start_state = get_obj_state(stages_list[segment_idx], oid)
-                        end_state = get_obj_state(stages_list[segment_idx+1], oid)
-                        
-                        if start_state and end_state:
-                             sx, sy = get_pos(start_state)
-                             ex, ey = get_pos(end_state)
-                             base_x = sx + (ex - sx) * progress
-                             base_y = sy + (ey - sy) * progress
-                        elif start_state:
-                             base_x, base_y = get_pos(start_state)
-                        elif end_state:
-                             base_x, base_y = get_pos(end_state)
-                        else:
-                             base_x, base_y = (-1000, -1000)
-
-                    # B. Apply Entrance Animation (only during first stage of this object)
-                    time_in_first_stage = global_t - (first_idx * dur_per_stage)
-                    if time_in_first_stage >= 0 and time_in_first_stage < dur_per_stage:
-                        prog = time_in_first_stage / dur_per_stage
-                        eased_prog = ease_out_cubic(prog)
-                        
-                        if style == "slide_from_bottom":
-                             start_y_off = VIDEO_SIZE[1] + 100
-                             s0 = get_obj_state(stages_list[first_idx], oid)
-                             target_x, target_y = get_pos(s0) if s0 else (base_x, base_y)
-                             current_y = start_y_off + (target_y - start_y_off) * eased_prog
-                             return (base_x, int(current_y)) 
-                             
-                        elif style == "slide_from_side":
-                            s0 = get_obj_state(stages_list[first_idx], oid)
-                            target_x, target_y = get_pos(s0) if s0 else (base_x, base_y)
-                            
-                            if target_x > VIDEO_SIZE[0] / 2:
-                                start_x = VIDEO_SIZE[0] + 100
-                            else:
-                                start_x = -base_w - 100
-                            
-                            current_x = start_x + (target_x - start_x) * eased_prog
-                            return (int(current_x), base_y)
-
-                    return (base_x, base_y)
-                return pos
-
-            # Apply Position
-            img_clip = img_clip.with_position(make_pos_func(obj_id, stages, TRANSITION_DURATION, anim_style, start_time, first_stage_idx))
-            
-            # Apply Fade Effects
-            fade_duration = min(0.5, obj_duration / 2)
-            if anim_style == "fade_in" or anim_style == "wipe_reveal":
-                img_clip = img_clip.with_effects([vfx.CrossFadeIn(fade_duration)])
-            
-            # Apply fade out if object disappears before video ends
-            if last_stage_idx < len(stages) - 1:
-                img_clip = img_clip.with_effects([vfx.CrossFadeOut(fade_duration)])
-
-            img_clip = img_clip.with_start(start_time)
-
-            clips.append(img_clip)
+        assets = AssetCache(args.asset_memory * 1024 * 1024, args.asset_cache, args.asset_cache_size * 1024 * 1024)
+        scale, fps, preset = render_settings(args.preview, args.scale, args.fps)
+        if args.stills:
+            if args.frame_range:
+                print("Error: --stills takes --stage, not --frame-range.")
+                return
+            render_stills(data, args.stills, args.still_format, args.stage, scale, assets)
+            print("Done!")
+            return
 
-        # 4. Render
-        print("Compositing...")
-        final = CompositeVideoClip(clips, size=VIDEO_SIZE)
-        
-        print(f"Rendering to {OUTPUT_FILE} ({total_duration}s)...")
-        final.write_videofile(OUTPUT_FILE, fps=FPS)
+        compositor = render_storyboard(data, OUTPUT_FILE, args.workers, args.cache_dir, args.cache_size,
+                                       assets=assets, scale=scale, fps=fps, preset=preset,
+                                       stage=args.stage, frame_range=args.frame_range, outputs=args.outputs)
+        if args.verify and args.workers > 1:
+            start, stop = select_frames(compositor.timeline, args.stage, args.frame_range)
+            if not verify_against_serial(compositor, range(start, stop), fps, OUTPUT_FILE, preset):
+                sys.exit(1)
+        if args.timings:
+            print_timings()
         print("Done!")
 
     except Exception as e:
         print(f"CRITICAL ERROR: {e}")
         traceback.print_exc()
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,77 @@
+import os
+
+from assets import AssetCache
+from compositor import Compositor
+from timeline import Timeline
+
+# ==========================================
+# SCENE SETUP
+# ==========================================
+
+
+def video_scale(artboard):
+    """Small artboards are rendered at 3x so the video isn't tiny."""
+    if artboard['width'] < 500:
+        return 3
+    return 1
+
+def build_compositor(data, assets_dir, fps, stage_duration, verbose=True, load=None, scale=None):
+    """
+    Compile the timeline and load every object's sprite for a storyboard.
+    `load(path, box_size)` produces the sprites; by default a fresh
+    AssetCache, so objects sharing an image share its pixels. Long-lived
+    callers pass their own cache so assets stay decoded between renders.
+    `scale` overrides the artboard-to-video scale picked by video_scale.
+
+    Returns a ready-to-use Compositor; its `timeline` carries the video size,
+    frame count and per-object metadata.
+    """
+    log = print if verbose else (lambda *a, **k: None)
+    load = load or AssetCache()
+
+    stages = data['stages']
+    res = data.get('artboard', {'width': 360, 'height': 640})
+
+    # Scale logic
+    if scale:
+        # Even dimensions, like parse_output_spec: libx264 needs them for
+        # yuv420p, and moviepy silently falls back to yuv444p without
+        video_size = (int(round(res['width'] * scale / 2)) * 2, int(round(res['height'] * scale / 2)) * 2)
+    else:
+        scale = video_scale(res)
+        video_size = (int(res['width'] * scale), int(res['height'] * scale))
+    log(f"Rendering at {video_size}")
+
+    # Compile keyframes once; per-frame lookups are array indexes from here on
+    timeline = Timeline(stages, video_size, scale, fps, stage_duration)
+    log(f"DEBUG: Found {len(timeline.objects)} unique objects.")
+
+    # Load Sprites (decoded and resized once per object)
+    log(f"DEBUG: Processing objects...")
+    sprites = {}
+
+    for obj in timeline.objects:
+        obj_id = obj.id
+        if obj.end_time - obj.start_time <= 0:
+            continue
+
+        filename = obj.filename
+        if not filename:
+            log(f"Warning: Object {obj_id} has no filename.")
+            continue
+
+        # Handle API URLs (e.g. /api/images/foo.png -> foo.png)
+        filename = os.path.basename(filename)
+
+        path = os.path.join(assets_dir, filename)
+        if not os.path.exists(path):
+            log(f"Warning: Asset {filename} not found at {path}")
+            continue
+
+        sprites[obj_id] = load(path, obj.size)
+
+    if isinstance(load, AssetCache):
+        stats = load.stats
+        log(f"DEBUG: Assets decoded {stats['decodes']}, resized {stats['resizes']}, "
+            f"reused {stats['hits']}, mapped from disk {stats['disk_hits']}")
+    return Compositor(timeline, sprites)
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import uuid
+
+from encode import CODEC, PRESET, concat_segments
+from parallel import render_segments
+
+# ==========================================
+# SEGMENT CACHE
+# ==========================================
+
+# Bump when compositing or encoding changes in a way old segments don't reflect
+CACHE_VERSION = 1
+
+
+def file_fingerprint(path, _memo={}):
+    """Content hash of an asset file, memoized per (path, mtime, size)."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    if key not in _memo:
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        _memo[key] = h.hexdigest()
+    return _memo[key]
+
+def segment_key(compositor, start, stop, stage_idx, preset=PRESET):
+    """
+    Hash everything that can change the pixels of frames [start, stop):
+    render settings, the stage pair the segment interpolates between, and
+    for every object visible in it, its states in that pair, entrance style,
+    layer, box size, source asset content and compiled (x, y, alpha) track.
+
+    The absolute frame position is deliberately left out, so inserting or
+    removing a stage doesn't invalidate the untouched segments after it.
+    """
+    timeline = compositor.timeline
+    h = hashlib.sha1()
+    h.update(json.dumps({
+        'version': CACHE_VERSION,
+        'codec': CODEC,
+        'preset': preset,
+        'fps': timeline.fps,
+        'size': timeline.video_size,
+        'frames': stop - start,
+    }).encode())
+
+    pair = [stage_idx, min(stage_idx + 1, len(timeline.stages) - 1)]
+    for obj in compositor.order:
+        track = timeline.frames[obj.row, start:stop]
+        if not (track[:, 2] > 0).any():
+            continue
+        h.update(json.dumps({
+            'id': obj.id,
+            'states': [timeline.state(obj.id, i) for i in pair],
+            'first': timeline.state(obj.id, obj.first_stage),
+            'style': obj.style,
+            'layer': obj.layer,
+            'size': obj.size,
+            'asset': file_fingerprint(compositor.sprites[obj.id].source),
+        }, sort_keys=True).encode())
+        h.update(track.tobytes())
+    return h.hexdigest()
+
+class SegmentCache:
+    """
+    Encoded segments on disk, named by their content key. Least recently
+    used files are evicted once the directory grows past `max_bytes`; a hit
+    refreshes the file's mtime, which is what recency is measured by.
+    """
+
+    def __init__(self, cache_dir, max_bytes, ext=".mp4"):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ext = ext
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + self.ext)
+
+    def lookup(self, key):
+        """Path of a cached segment (marked as used), or None."""
+        path = self.path(key)
+        if os.path.exists(path):
+            os.utime(path)
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def partial_path(self, key):
+        """Private scratch file, so concurrent renders never share one."""
+        return os.path.join(self.cache_dir, f"{key}.{uuid.uuid4().hex[:8]}.partial{self.ext}")
+
+    def commit(self, tmp_path, key):
+        """Move a freshly encoded segment into place."""
+        os.replace(tmp_path, self.path(key))
+
+    def evict(self, keep=()):
+        """Drop least recently used segments until the cache fits, sparing `keep`."""
+        keep = {self.path(k) for k in keep}
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(self.ext) and ".partial" not in name and os.path.isfile(path):
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            os.remove(path)
+            total -= size
+            evicted += 1
+        return evicted
+
+def render_cached(compositor, scene, output, workers, cache, progress=None, frames=None):
+    """
+    Render the timeline one stage-long segment at a time, reusing encoded
+    segments whose key is already in `cache` and encoding only the rest.
+    `frames` limits the render to a (start, stop) slice of the timeline;
+    stages it cuts through become shorter segments.
+    """
+    timeline = compositor.timeline
+    first, last = frames or (0, timeline.n_frames)
+    per_stage = int(round(scene['stage_duration'] * scene['fps']))
+    preset = scene.get('preset', PRESET)
+    keys, jobs = [], []
+    hit_frames = 0
+    for k, stage_start in enumerate(range(0, timeline.n_frames, per_stage)):
+        start = max(stage_start, first)
+        stop = min(stage_start + per_stage, timeline.n_frames, last)
+        if stop <= start:
+            continue
+        key = segment_key(compositor, start, stop, k, preset)
+        if key in keys or cache.lookup(key) is not None:
+            hit_frames += stop - start
+        else:
+            jobs.append((start, stop, key))
+        keys.append(key)
+    if progress and hit_frames:
+        progress(hit_frames)
+
+    print(f"DEBUG: Segment cache: {cache.hits} hits, {cache.misses} misses ({len(keys)} segments)")
+    pending = [(start, stop, cache.partial_path(key)) for start, stop, key in jobs]
+    try:
+        render_segments(pending, workers, compositor, scene, progress)
+        for (_, _, key), (_, _, tmp_path) in zip(jobs, pending):
+            cache.commit(tmp_path, key)
+    finally:
+        for _, _, tmp_path in pending:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    print(f"Concatenating {len(keys)} segments...")
+    concat_segments([cache.path(key) for key in keys], output)
+    evicted = cache.evict(keep=keys)
+    if evicted:
+        print(f"DEBUG: Segment cache evicted {evicted} old segments")
@@ -0,0 +1,350 @@
+import argparse
+import json
+import os
+import queue
+import re
+import socketserver
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+from assets import DEFAULT_DISK_MB, DEFAULT_MEMORY_MB, AssetCache
+from render import DEFAULT_CACHE_MB, render_settings, render_storyboard
+
+# ==========================================
+# CONFIGURATION & DEFAULTS
+# ==========================================
+
+DEFAULT_SOCKET = "render.sock"
+DEFAULT_OUTPUT_DIR = "renders"
+DEFAULT_CONCURRENCY = 1
+# Finished jobs (and their output files) are kept this long, and only the
+# newest this many, so the output directory and job table stay bounded
+DEFAULT_KEEP_JOBS = 50
+DEFAULT_MAX_AGE_HOURS = 24
+JOB_OUTPUT = re.compile(r"^[0-9a-f]{12}\.mp4$")
+
+# ==========================================
+# JOBS
+# ==========================================
+
+
+class Job:
+    """One queued render. Watchers block on `changed` until `version` moves."""
+
+    def __init__(self, job_id, data, output, options):
+        self.id = job_id
+        self.data = data
+        self.output = output
+        self.options = options
+        self.state = "queued"
+        self.frame = 0
+        self.total = 0
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def update(self, **fields):
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait(self, version, timeout=None):
+        """Block until the job changes past `version`; returns the new version."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    @property
+    def finished_state(self):
+        return self.state in ("done", "failed")
+
+    def snapshot(self):
+        """Status event describing the job right now, with an ETA while running."""
+        with self.changed:
+            event = {
+                "event": "done" if self.state == "done" else "failed" if self.state == "failed" else "progress",
+                "job": self.id,
+                "state": self.state,
+                "frame": self.frame,
+                "total": self.total,
+                "output": self.output,
+            }
+            if self.state == "running" and self.frame and self.total:
+                elapsed = time.time() - self.started
+                event["fps"] = round(self.frame / elapsed, 2)
+                event["eta"] = round(elapsed / self.frame * (self.total - self.frame), 2)
+            if self.finished_state:
+                event["elapsed"] = round(self.finished - (self.started or self.finished), 2)
+            if self.error:
+                event["error"] = self.error
+            return event
+
+# ==========================================
+# SERVICE
+# ==========================================
+
+
+class RenderService:
+    """
+    Resident renderer: imports and decoded assets stay warm, jobs are queued
+    and run `concurrency` at a time, each writing to its own output file.
+    Finished jobs and their outputs are pruned past `keep_jobs` or `max_age`
+    seconds.
+    """
+
+    def __init__(self, output_dir, concurrency=DEFAULT_CONCURRENCY, cache_dir=None,
+                 cache_size=DEFAULT_CACHE_MB, workers=1, assets=None,
+                 keep_jobs=DEFAULT_KEEP_JOBS, max_age=DEFAULT_MAX_AGE_HOURS * 3600):
+        self.output_dir = output_dir
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.workers = workers
+        self.keep_jobs = keep_jobs
+        self.max_age = max_age
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.assets = assets or AssetCache()
+        os.makedirs(output_dir, exist_ok=True)
+        # Outputs left by an earlier run are subject to the same limits
+        self.prune()
+        for _ in range(max(1, concurrency)):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, data, options=None):
+        options = options or {}
+        job_id = uuid.uuid4().hex[:12]
+        output = os.path.abspath(os.path.join(self.output_dir, f"{job_id}.mp4"))
+        job = Job(job_id, data, output, options)
+        with self.lock:
+            self.jobs[job_id] = job
+        self.queue.put(job)
+        return job
+
+    def prune(self):
+        """
+        Forget finished jobs beyond the newest `keep_jobs` or older than
+        `max_age`, and delete job output files under the same rule. Outputs
+        of queued and running jobs are never touched.
+        """
+        now = time.time()
+        with self.lock:
+            finished = sorted(
+                (job for job in self.jobs.values() if job.finished_state),
+                key=lambda job: job.finished, reverse=True,
+            )
+            for k, job in enumerate(finished):
+                if k >= self.keep_jobs or now - job.finished > self.max_age:
+                    del self.jobs[job.id]
+            active = {job.output for job in self.jobs.values() if not job.finished_state}
+
+        outputs = []
+        for name in os.listdir(self.output_dir):
+            path = os.path.abspath(os.path.join(self.output_dir, name))
+            if JOB_OUTPUT.match(name) and path not in active:
+                try:
+                    outputs.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        outputs.sort(reverse=True)
+        removed = 0
+        for k, (mtime, path) in enumerate(outputs):
+            if k >= self.keep_jobs or now - mtime > self.max_age:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        if removed:
+            print(f"DEBUG: Pruned {removed} old render outputs")
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            try:
+                self._run(job)
+                self.prune()
+            finally:
+                self.queue.task_done()
+
+    def _run(self, job):
+        job.update(state="running", started=time.time())
+        try:
+            if not job.data.get('stages'):
+                raise ValueError("No stages found.")
+            options = job.options
+            scale, fps, preset = render_settings(options.get('preview', False), options.get('scale'), options.get('fps'))
+            frame_range = options.get('frames')
+            render_storyboard(
+                job.data,
+                job.output,
+                workers=job.options.get('workers', self.workers),
+                cache_dir=self.cache_dir if job.options.get('cache', True) else None,
+                cache_size=self.cache_size,
+                progress=lambda done, total: job.update(frame=done, total=total),
+                assets=self.assets,
+                scale=scale,
+                fps=fps,
+                preset=preset,
+                stage=options.get('stage'),
+                frame_range=tuple(frame_range) if frame_range else None,
+            )
+            job.update(state="done", finished=time.time())
+        except Exception as e:
+            traceback.print_exc()
+            job.update(state="failed", error=str(e), finished=time.time())
+        finally:
+            job.data = None
+
+    def handle(self, message, send):
+        """
+        Answer one protocol message, calling `send(event)` for each reply.
+
+          {"op": "submit", "data": {...}, "options": {...}, "watch": false}
+              options: workers, cache, preview, scale, fps, stage, frames [a, b]
+          {"op": "status", "job": id}
+          {"op": "watch", "job": id}
+          {"op": "ping"}
+        """
+        op = message.get("op")
+        if op == "ping":
+            send({"event": "pong", "queued": self.queue.qsize()})
+        elif op == "submit":
+            job = self.submit(message["data"], message.get("options"))
+            send({"event": "queued", "job": job.id, "output": job.output, "position": self.queue.qsize()})
+            if message.get("watch"):
+                self.watch(job, send)
+        elif op in ("status", "watch"):
+            with self.lock:
+                job = self.jobs.get(message.get("job"))
+            if job is None:
+                send({"event": "error", "error": f"Unknown job {message.get('job')}"})
+            elif op == "status":
+                send(job.snapshot())
+            else:
+                self.watch(job, send)
+        else:
+            send({"event": "error", "error": f"Unknown op {op!r}"})
+
+    def watch(self, job, send):
+        """Stream progress events for `job` until it finishes."""
+        version = -1
+        while True:
+            version = job.wait(version, timeout=30)
+            event = job.snapshot()
+            send(event)
+            if job.finished_state:
+                return
+
+# ==========================================
+# TRANSPORTS
+# ==========================================
+
+
+def serve_socket(service, socket_path):
+    """JSON-lines over a local Unix socket, one thread per connection."""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            def send(event):
+                self.wfile.write((json.dumps(event) + "\n").encode())
+                self.wfile.flush()
+
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    service.handle(json.loads(line), send)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                except Exception as e:
+                    send({"event": "error", "error": str(e)})
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+    server.daemon_threads = True
+    print(f"Render service listening on {socket_path}", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+def serve_stdio(service, out):
+    """
+    JSON-lines over stdin and `out` (the real stdout, which main() has
+    already swapped for stderr so render logs never reach the protocol
+    channel); every reply streams on the one channel.
+    """
+    lock = threading.Lock()
+
+    def send(event):
+        with lock:
+            out.write(json.dumps(event) + "\n")
+            out.flush()
+
+    def run(message):
+        try:
+            service.handle(message, send)
+        except Exception as e:
+            send({"event": "error", "error": str(e)})
+
+    threads = []
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            message = json.loads(line)
+        except ValueError as e:
+            send({"event": "error", "error": str(e)})
+            continue
+        # Watches block, so each message gets its own thread
+        thread = threading.Thread(target=run, args=(message,), daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    # stdin closed: let queued jobs and their watchers finish
+    service.queue.join()
+    for thread in threads:
+        thread.join()
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident storyboard render service.')
+    parser.add_argument('--socket', type=str, default=DEFAULT_SOCKET, help='Unix socket path to listen on')
+    parser.add_argument('--stdio', action='store_true', help='Speak JSON-lines on stdin/stdout instead of a socket')
+    parser.add_argument('--output-dir', type=str, default=DEFAULT_OUTPUT_DIR, help='Directory for per-job output files')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Jobs rendered at the same time')
+    parser.add_argument('--workers', type=int, default=1, help='Default segment workers per job')
+    parser.add_argument('--cache-dir', type=str, default=None, help='Segment cache shared by all jobs')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_MB, help='Segment cache size limit in MB')
+    parser.add_argument('--asset-cache', type=str, default=None, help='Keep resized assets as memory-mapped .npy files here')
+    parser.add_argument('--asset-memory', type=int, default=DEFAULT_MEMORY_MB, help='Decoded asset memory limit in MB')
+    parser.add_argument('--asset-cache-size', type=int, default=DEFAULT_DISK_MB, help='Asset .npy store size limit in MB')
+    parser.add_argument('--keep-jobs', type=int, default=DEFAULT_KEEP_JOBS, help='Finished jobs and outputs to keep')
+    parser.add_argument('--max-age', type=float, default=DEFAULT_MAX_AGE_HOURS, help='Hours to keep finished jobs and outputs')
+    args = parser.parse_args()
+
+    protocol_out = sys.stdout
+    if args.stdio:
+        # Before the service starts logging, e.g. its start-up prune
+        sys.stdout = sys.stderr
+
+    assets = AssetCache(args.asset_memory * 1024 * 1024, args.asset_cache, args.asset_cache_size * 1024 * 1024)
+    service = RenderService(args.output_dir, args.concurrency, args.cache_dir, args.cache_size, args.workers, assets,
+                            args.keep_jobs, args.max_age * 3600)
+    if args.stdio:
+        serve_stdio(service, protocol_out)
+    else:
+        serve_socket(service, args.socket)
+
+if __name__ == "__main__":
+    main()
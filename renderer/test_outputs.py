@@ -0,0 +1,26 @@
+import pytest
+
+from outputs import parse_output_spec
+
+MASTER = (1080, 1920)
+
+
+def test_wxh_kept_when_even():
+    target = parse_output_spec("social.mp4:360x640:15", MASTER, 30)
+    assert target.size == (360, 640)
+    assert target.fps == 15
+    assert target.codec == "libx264"
+
+def test_odd_wxh_rounded_to_even():
+    # libx264 refuses odd yuv420p sizes and would abort every output
+    assert parse_output_spec("q2.mp4:405x720", MASTER, 30).size == (404, 720)
+    assert parse_output_spec("o4.mp4:361x641", MASTER, 30).size == (360, 640)
+    assert parse_output_spec("tiny.mp4:1x1", MASTER, 30).size == (2, 2)
+
+def test_short_side_keeps_aspect_and_is_even():
+    assert parse_output_spec("hd.mp4:720p", MASTER, 30).size == (720, 1280)
+    assert parse_output_spec("odd.mp4:99p", (360, 640), 30).size == (100, 176)
+
+def test_fps_above_master_rejected():
+    with pytest.raises(ValueError):
+        parse_output_spec("fast.mp4:60", MASTER, 30)
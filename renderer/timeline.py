@@ -0,0 +1,215 @@
+import numpy as np
+from dataclasses import dataclass
+
+import timing
+
+# ==========================================
+# ANIMATION LIBRARY
+# ==========================================
+
+OFFSCREEN = (-1000, -1000)
+FADE_IN_STYLES = ("fade_in", "wipe_reveal")
+
+
+def ease_out_cubic(t):
+    """Math helper: Makes movement fast at start, slow at end."""
+    return 1 - pow(1 - t, 3)
+
+def stage_assets(stage_data):
+    """Stages are either {'assets': [...]} dicts or bare asset lists."""
+    if isinstance(stage_data, dict):
+        return stage_data.get('assets', [])
+    return stage_data
+
+def state_position(state, scale):
+    """Top-left corner of an object state, in output pixels."""
+    if 'position' in state:
+        return state['position']['x'] * scale, state['position']['y'] * scale
+    return state['x'] * scale, state['y'] * scale
+
+def state_size(state, scale):
+    """Box size of an object state, in output pixels."""
+    if 'size' in state:
+        return state['size']['width'] * scale, state['size']['height'] * scale
+    return state['width'] * scale, state['height'] * scale
+
+# ==========================================
+# COMPILED TIMELINE
+# ==========================================
+
+
+@dataclass
+class TimelineObject:
+    """Per-object metadata, taken from the first stage the object appears in."""
+    id: str
+    row: int
+    filename: str
+    size: tuple
+    style: str
+    layer: float
+    first_stage: int
+    last_stage: int
+    start_time: float
+    end_time: float
+
+
+class Timeline:
+    """
+    Keyframe timeline compiled once per render.
+
+    `states[id]` holds the object's state for every stage (None where it is
+    absent) and `frames[row, i]` holds its (x, y, alpha) at output frame `i`,
+    with x/y already truncated to the pixel the compositor blits at. Looking
+    up a position is an array index instead of a walk over the stages.
+    """
+
+    def __init__(self, stages, video_size, scale, fps, stage_duration):
+        self.stages = stages
+        self.video_size = video_size
+        self.scale = scale
+        self.fps = fps
+        self.stage_duration = stage_duration
+        self.total_duration = len(stages) * stage_duration
+        if self.total_duration == 0: self.total_duration = 2.0
+        self.n_frames = int(self.total_duration * fps)
+
+        # id -> per-stage state index, ordered by first appearance
+        self.states = {}
+        for i, stage in enumerate(stages):
+            for item in stage_assets(stage):
+                per_stage = self.states.setdefault(item['id'], [None] * len(stages))
+                if per_stage[i] is None:
+                    per_stage[i] = item
+
+        self.objects = []
+        for obj_id, per_stage in self.states.items():
+            present = [i for i, s in enumerate(per_stage) if s]
+            first_idx, last_idx = present[0], present[-1]
+            start_time = first_idx * stage_duration
+            end_time = min((last_idx + 1) * stage_duration, self.total_duration)
+            first_state = per_stage[first_idx]
+            self.objects.append(TimelineObject(
+                id=obj_id,
+                row=len(self.objects),
+                filename=first_state.get('filename'),
+                size=state_size(first_state, scale),
+                style=first_state.get('animationStyle', 'fade_in'),
+                layer=first_state.get('layerOrder', 0),
+                first_stage=first_idx,
+                last_stage=last_idx,
+                start_time=start_time,
+                end_time=end_time,
+            ))
+
+        with timing.phase("positions"):
+            self.frames = self._compile()
+
+    def state(self, obj_id, stage_idx):
+        """Object state in one stage, or None if it is absent there."""
+        return self.states[obj_id][stage_idx]
+
+    def stage_frames(self, stage_idx):
+        """(start, stop) output frames of a stage's slot in the video."""
+        per_stage = self.stage_duration * self.fps
+        start = min(int(round(stage_idx * per_stage)), self.n_frames)
+        stop = min(int(round((stage_idx + 1) * per_stage)), self.n_frames)
+        return start, stop
+
+    def stage_pose(self, stage_idx):
+        """
+        (x, y, alpha) per object at rest in a stage: at its keyframe, fully
+        opaque, entrance finished. Objects absent from the stage get alpha 0.
+        """
+        pose = np.zeros((len(self.objects), 3))
+        for obj in self.objects:
+            state = self.states[obj.id][stage_idx]
+            if state:
+                x, y = state_position(state, self.scale)
+                pose[obj.row] = (np.trunc(x), np.trunc(y), 1.0)
+        return pose
+
+    def _compile(self):
+        n_obj, n_stages = len(self.objects), len(self.stages)
+        T = self.stage_duration
+        W, H = self.video_size
+        out = np.zeros((n_obj, self.n_frames, 3))
+        if n_obj == 0 or self.n_frames == 0:
+            return out
+
+        # Keyframes: (n_obj, n_stages) positions plus a presence mask
+        key_x = np.full((n_obj, n_stages), float(OFFSCREEN[0]))
+        key_y = np.full((n_obj, n_stages), float(OFFSCREEN[1]))
+        present = np.zeros((n_obj, n_stages), dtype=bool)
+        for obj in self.objects:
+            for i, state in enumerate(self.states[obj.id]):
+                if state:
+                    key_x[obj.row, i], key_y[obj.row, i] = state_position(state, self.scale)
+                    present[obj.row, i] = True
+
+        t = np.arange(self.n_frames) / self.fps
+        seg = (t // T).astype(int)
+        progress = np.mod(t, T) / T
+
+        # A. Base keyframe interpolation
+        last = seg >= n_stages - 1
+        s_idx = np.minimum(seg, n_stages - 1)
+        e_idx = np.minimum(seg + 1, n_stages - 1)
+        s_on, e_on = present[:, s_idx], present[:, e_idx]
+        sx, sy = key_x[:, s_idx], key_y[:, s_idx]
+        ex, ey = key_x[:, e_idx], key_y[:, e_idx]
+
+        both = s_on & e_on & ~last
+        base_x = np.where(both, sx + (ex - sx) * progress, np.where(s_on | last, sx, ex))
+        base_y = np.where(both, sy + (ey - sy) * progress, np.where(s_on | last, sy, ey))
+        # Absent everywhere (or absent in the last stage) -> offscreen; that is
+        # exactly what key_x/key_y already hold for missing keyframes.
+
+        # B. Entrance animation (only during the object's first stage)
+        first = np.array([obj.first_stage for obj in self.objects])[:, None]
+        in_first = t[None, :] - first * T
+        entering = (in_first >= 0) & (in_first < T)
+        eased = ease_out_cubic(np.clip(in_first / T, 0, 1))
+        target_x = key_x[np.arange(n_obj), first[:, 0]][:, None]
+        target_y = key_y[np.arange(n_obj), first[:, 0]][:, None]
+
+        x, y = base_x, base_y
+        for obj in self.objects:
+            r = obj.row
+            if obj.style == "slide_from_bottom":
+                start_y = H + 100
+                slide_y = np.trunc(start_y + (target_y[r] - start_y) * eased[r])
+                y[r] = np.where(entering[r], slide_y, y[r])
+            elif obj.style == "slide_from_side":
+                if target_x[r, 0] > W / 2:
+                    start_x = W + 100
+                else:
+                    # The object's own width. The old per-clip pos() closure
+                    # read a late-bound `base_w`, i.e. the width of whichever
+                    # object was loaded last, so left-side slides started
+                    # from the wrong x whenever widths differed.
+                    start_x = -obj.size[0] - 100
+                slide_x = np.trunc(start_x + (target_x[r] - start_x) * eased[r])
+                x[r] = np.where(entering[r], slide_x, x[r])
+
+        # C. Visibility and cross-fades (relative to the object's own clip)
+        alpha = np.zeros((n_obj, self.n_frames))
+        for obj in self.objects:
+            r = obj.row
+            duration = obj.end_time - obj.start_time
+            if duration <= 0:
+                continue
+            local = t - obj.start_time
+            visible = (local >= 0) & (t < obj.end_time)
+            a = np.ones(self.n_frames)
+            fade = min(0.5, duration / 2)
+            if obj.style in FADE_IN_STYLES:
+                a = np.where(local < fade, local / fade, a)
+            if obj.last_stage < n_stages - 1:
+                remaining = duration - local
+                a = np.where(remaining < fade, a * remaining / fade, a)
+            alpha[r] = np.where(visible, a, 0.0)
+
+        out[:, :, 0] = np.trunc(x)
+        out[:, :, 1] = np.trunc(y)
+        out[:, :, 2] = alpha
+        return out
@@ -0,0 +1,61 @@
+import threading
+import time
+from contextlib import nullcontext
+
+# ==========================================
+# PHASE TIMING
+# ==========================================
+
+# Opt-in: until enable() is called every phase() is a shared no-op context,
+# so the hooks left in the render path cost next to nothing.
+_enabled = False
+_totals = {}  # phase name -> [seconds, calls]
+_lock = threading.Lock()  # encoder threads record phases too
+_NULL = nullcontext()
+
+
+class _Phase:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            total = _totals.setdefault(self.name, [0.0, 0])
+            total[0] += elapsed
+            total[1] += 1
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+def enabled():
+    return _enabled
+
+def phase(name):
+    """Context manager adding its wall time to `name` while timing is enabled."""
+    return _Phase(name) if _enabled else _NULL
+
+def reset():
+    _totals.clear()
+
+def snapshot():
+    """{phase: {"seconds": s, "calls": n}} accumulated since the last reset."""
+    return {
+        name: {"seconds": round(seconds, 6), "calls": calls}
+        for name, (seconds, calls) in sorted(_totals.items())
+    }
+
+def merge(other):
+    """Add another process's snapshot() into this one's totals."""
+    with _lock:
+        for name, entry in other.items():
+            total = _totals.setdefault(name, [0.0, 0])
+            total[0] += entry["seconds"]
+            total[1] += entry["calls"]